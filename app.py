@@ -1,43 +1,133 @@
 import streamlit as st
 import pandas as pd
 import requests
-import dropbox
+from requests.adapters import HTTPAdapter
+import codecs
+import csv
+import datetime
+import hashlib
+import importlib
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
 from io import BytesIO, StringIO
 try:
-    import chardet
-    HAS_CHARDET = True
+    import pyarrow as pa
+    import pyarrow.csv as pacsv
+    HAS_PYARROW = True
 except ImportError:
-    HAS_CHARDET = False
+    HAS_PYARROW = False
 
-def sanitize_value(value):
-    if value is None:
-        return ""
-    value_str = str(value).strip()
-    if value_str.lower() in ("nan", "none"):
-        return ""
-    return value_str
+@st.cache_resource(show_spinner=False)
+def charset_detector():
+    """文字コード判定ライブラリを初回利用時に読み込む（高速なものを優先。いずれも detect() の互換APIを持つ）"""
+    for name in ('cchardet', 'charset_normalizer', 'chardet'):
+        try:
+            return importlib.import_module(name)
+        except ImportError:
+            continue
+    return None
+
+def sanitize_frame(df):
+    """全セルを前後空白を除いた文字列にし、欠損値や「nan」「None」を空文字に変換する"""
+    cleaned = df.fillna('').astype(str).apply(lambda s: s.str.strip())
+    return cleaned.mask(cleaned.apply(lambda s: s.str.lower()).isin(['nan', 'none']), '')
 
 # ==============================
 # Dropbox永続接続処理
 # ==============================
+@st.cache_resource(show_spinner=False)
+def _get_session():
+    """トークン更新とDropbox APIの呼び出しで共有するHTTPセッション（再実行をまたいでTLS接続を使い回す）"""
+    session = requests.Session()
+    session.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=8))
+    return session
+
+# 取得したアクセストークンの保存先（コンテナ再起動後も有効期限内なら再利用する）
+TOKEN_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "idmgr", "tok.json")
+
+def _credentials_key():
+    """保存したトークンがどの認証情報で取得したものかを判定するためのハッシュ"""
+    credentials = f'{st.secrets["DROPBOX_APP_KEY"]}:{st.secrets["DROPBOX_REFRESH_TOKEN"]}'
+    return hashlib.sha256(credentials.encode('utf-8')).hexdigest()
+
+def _load_cached_token():
+    """ディスクに保存したトークンを読み込む（残り60秒以下・認証情報が異なる・未保存ならNone）"""
+    try:
+        with open(TOKEN_CACHE_PATH, encoding='utf-8') as f:
+            cached = json.load(f)
+        if cached["key"] == _credentials_key() and cached["expiry"] - time.time() > 60:
+            return cached["token"], cached["expiry"]
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+    return None
+
+def _save_cached_token(token, expiry):
+    """トークンと有効期限をディスクに保存（本人のみ読み書き可）"""
+    try:
+        os.makedirs(os.path.dirname(TOKEN_CACHE_PATH), exist_ok=True)
+        fd = os.open(TOKEN_CACHE_PATH, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump({"key": _credentials_key(), "token": token, "expiry": expiry}, f)
+    except OSError:
+        pass
+
+def _clear_cached_token():
+    """ディスクに保存したトークンを削除（認証エラー時に同じトークンを再利用しないため）"""
+    try:
+        os.remove(TOKEN_CACHE_PATH)
+    except OSError:
+        pass
+
 def get_dropbox_access_token():
+    """アクセストークンと有効期限（UNIX時刻）を取得"""
+    cached = _load_cached_token()
+    if cached:
+        return cached
     data = {
         "grant_type": "refresh_token",
         "refresh_token": st.secrets["DROPBOX_REFRESH_TOKEN"],
         "client_id": st.secrets["DROPBOX_APP_KEY"],
         "client_secret": st.secrets["DROPBOX_APP_SECRET"],
     }
-    res = requests.post("https://api.dropboxapi.com/oauth2/token", data=data)
+    res = _get_session().post("https://api.dropboxapi.com/oauth2/token", data=data)
     res.raise_for_status()
-    return res.json()["access_token"]
+    body = res.json()
+    token = body["access_token"]
+    expiry = time.time() + body.get("expires_in", 4 * 3600)
+    _save_cached_token(token, expiry)
+    return token, expiry
 
-ACCESS_TOKEN = get_dropbox_access_token()
-dbx = dropbox.Dropbox(ACCESS_TOKEN)
+@st.cache_resource(show_spinner=False)
+def dropbox_sdk():
+    """Dropbox SDKを初回利用時に読み込む（ローカルファイルのみ扱う場合は読み込まない）"""
+    return importlib.import_module("dropbox")
+
+@st.cache_resource(ttl=3600 * 3)
+def _get_dbx():
+    """Dropboxクライアントを生成（期限切れ間近ならSDKがリフレッシュトークンで自動更新）"""
+    token, expiry = get_dropbox_access_token()
+    return dropbox_sdk().Dropbox(
+        oauth2_access_token=token,
+        oauth2_access_token_expiration=datetime.datetime.fromtimestamp(expiry, datetime.timezone.utc).replace(tzinfo=None),
+        oauth2_refresh_token=st.secrets["DROPBOX_REFRESH_TOKEN"],
+        app_key=st.secrets["DROPBOX_APP_KEY"],
+        app_secret=st.secrets["DROPBOX_APP_SECRET"],
+        session=_get_session(),
+    )
 
 # ==============================
 # 設定
 # ==============================
 DROPBOX_FILE_PATH = "/test/id_management_file.csv"
+# 分割送信のチャンクサイズ（並列セッションでは4MBの倍数である必要がある）と並列数
+UPLOAD_CHUNK_SIZE = 16 * 1024 * 1024
+UPLOAD_WORKERS = 4
+# これを超えるサイズはアップロードセッションで分割送信する（並列に送れるチャンクが2つ以上ある場合のみ）
+UPLOAD_SESSION_THRESHOLD = 2 * UPLOAD_CHUNK_SIZE
+# データエディタに非表示で持たせる、元のCSVの行番号の列（追加行は空になる）
+ROW_ID_COLUMN = "_row_id"
 
 st.set_page_config(page_title="ID採番管理", layout="wide")
 st.title("📋 ID採番管理")
@@ -46,42 +136,85 @@ st.caption("分配PID、分配ID、整備結果IDの年別最終IDを編集で
 # ==============================
 # CSVの読み込み（Shift-JIS対応）
 # ==============================
+def bom_encoding(data):
+    """BOMから文字コードを判定（BOMがなければNone）"""
+    if data.startswith(codecs.BOM_UTF8):
+        return 'utf-8-sig'
+    if data.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        return 'utf-16'
+    return None
+
+def decode_csv_bytes(data, encoding='shift_jis'):
+    """バイトデータを文字列に変換（BOM → 指定文字コード → UTF-8 → 自動判定の順に試す）"""
+    # BOM付きファイル（保存時のUTF-8フォールバックなど）は判定せずにそのまま確定
+    detected_bom = bom_encoding(data)
+    if detected_bom:
+        return data.decode(detected_bom)
+    try:
+        return data.decode(encoding)
+    except UnicodeDecodeError:
+        pass
+    try:
+        return data.decode('utf-8')
+    except UnicodeDecodeError:
+        pass
+    detector = charset_detector()
+    if detector is not None:
+        try:
+            # 文字コードはファイル全体で共通なので先頭64KBだけで判定する
+            detected = detector.detect(data[:64 * 1024])
+            detected_encoding = detected['encoding'] if detected['encoding'] else 'utf-8'
+            return data.decode(detected_encoding)
+        except (UnicodeDecodeError, LookupError):
+            pass
+    return data.decode('utf-8', errors='ignore')
+
+def read_csv_as_str(data, encoding='utf-8'):
+    """CSVのバイトデータを文字コード変換しながら、すべて文字列列のDataFrameとして解析（pyarrowがあれば優先）"""
+    if HAS_PYARROW:
+        try:
+            # 先頭行から列名だけ取り出し、全列を文字列型に固定する（IDの先頭0を保持するため）
+            head_text = codecs.getincrementaldecoder(encoding)(errors='replace').decode(data[:64 * 1024])
+            header = next(csv.reader(StringIO(head_text)), [])
+            table = pacsv.read_csv(
+                pa.BufferReader(data),
+                read_options=pacsv.ReadOptions(encoding=encoding),
+                parse_options=pacsv.ParseOptions(delimiter=',', newlines_in_values=True),
+                convert_options=pacsv.ConvertOptions(
+                    column_types={name: pa.string() for name in header},
+                    strings_can_be_null=False,
+                ),
+            )
+            # 先頭行が空行などで列名を取れず型推論された列があれば（IDの先頭0が落ちるため）pandasで読み直す
+            if all(field.type == pa.string() for field in table.schema):
+                return table.to_pandas()
+        except pa.ArrowException:
+            # 解析に失敗した場合はpandasで読み直し、pandas側のエラーメッセージを使う
+            pass
+    return pd.read_csv(BytesIO(data), header=0, dtype=str, keep_default_na=False, encoding=encoding)
+
+@st.cache_data(show_spinner=False, max_entries=4)
 def load_csv_from_bytes(data, encoding='shift_jis'):
-    """バイトデータからCSVを読み込む（Shift-JIS対応）"""
+    """バイトデータからCSVを読み込む（Shift-JIS対応、同じ内容なら解析結果をキャッシュ）"""
     try:
+        encoding = bom_encoding(data) or encoding
+        # すべての列を文字列として読み込む（IDを文字列として扱うため）
         try:
-            text_data = data.decode(encoding)
+            # 文字列へ一括デコードせず、バイトデータのまま解析する
+            df = read_csv_as_str(data, encoding)
         except UnicodeDecodeError:
-            try:
-                text_data = data.decode('utf-8')
-            except UnicodeDecodeError:
-                if HAS_CHARDET:
-                    try:
-                        detected = chardet.detect(data)
-                        encoding = detected['encoding'] if detected['encoding'] else 'utf-8'
-                        text_data = data.decode(encoding)
-                    except:
-                        text_data = data.decode('utf-8', errors='ignore')
-                else:
-                    text_data = data.decode('utf-8', errors='ignore')
-        
-        # すべての列を文字列として読み込む（IDを文字列として扱うため）
-        df = pd.read_csv(StringIO(text_data), header=0, dtype=str, keep_default_na=False)
+            # 指定の文字コードで読めない場合のみ、文字コードを判定してから解析
+            df = read_csv_as_str(decode_csv_bytes(data, encoding).encode('utf-8'))
         
         if len(df.columns) >= 4:
-            df_display = pd.DataFrame({
-                '年': df.iloc[:, 0].astype(str),
-                '分配PID': df.iloc[:, 1].astype(str),
-                '分配ID': df.iloc[:, 2].astype(str),
-                '整備結果ID': df.iloc[:, 3].astype(str)
-            })
+            # 先頭4列を取り出して列名だけ付け替える（列データは再構築しない）
+            df_display = df.iloc[:, :4].set_axis(['年', '分配PID', '分配ID', '整備結果ID'], axis=1)
         else:
-            df_display = df.copy()
-            # すべての列を文字列型に統一
-            for col in df_display.columns:
-                df_display[col] = df_display[col].astype(str)
+            # 解析時に全列を文字列として読み込んでいるため、そのまま使う
+            df_display = df
         
-        return df_display, None, text_data
+        # 保存時に元のCSV構造（5列目以降など）を保つため、解析済みの全列も返す
+        return df_display, None, df
     except pd.errors.EmptyDataError:
         return pd.DataFrame(), "❌ **エラー:** ファイルが空です", None
     except pd.errors.ParserError as pe:
@@ -89,13 +222,30 @@ def load_csv_from_bytes(data, encoding='shift_jis'):
     except Exception as e:
         return pd.DataFrame(), f"❌ **エラー:** ファイルの読み込みに失敗しました\n**詳細:** {e}", None
 
+@st.cache_data(show_spinner=False, max_entries=2)
+def _download(path, rev):
+    """指定リビジョンのファイルをダウンロード（revが変わるまでキャッシュ）"""
+    # キャッシュのキーと内容が一致するよう、revを指定してダウンロード
+    _, res = _get_dbx().files_download(path, rev=rev)
+    return res.content
+
+@st.cache_data(ttl=30, show_spinner=False)
+def _get_rev(path):
+    """ファイルのリビジョンを取得（再実行のたびにメタデータを問い合わせないよう短時間キャッシュ）"""
+    return _get_dbx().files_get_metadata(path).rev
+
 def load_csv_from_dropbox(path):
     """DropboxからCSVを読み込む"""
+    dropbox = dropbox_sdk()
     try:
-        _, res = dbx.files_download(path)
-        data = res.content
-        df, error_info, text_data = load_csv_from_bytes(data)
-        return df, error_info, text_data
+        # メタデータのrevをキーにして、未変更ならダウンロードと解析を省略
+        rev = _get_rev(path)
+        return load_csv_from_bytes(_download(path, rev))
+    except dropbox.exceptions.AuthError as e:
+        _clear_cached_token()
+        _get_dbx.clear()
+        error_info = f"❌ **エラー:** Dropboxの認証に失敗しました。再度お試しください\n**詳細:** {e}"
+        return pd.DataFrame(), error_info, None
     except dropbox.exceptions.ApiError as e:
         error_info = f"❌ **エラー:** ファイルが見つかりませんでした\n**指定されたパス:** `{path}`"
         return pd.DataFrame(), error_info, None
@@ -103,58 +253,99 @@ def load_csv_from_dropbox(path):
 # ==============================
 # CSVの保存
 # ==============================
-def save_csv_to_dropbox(df, path, original_text=None):
-    """DropboxにCSVを保存（元のCSV構造を保持）"""
+def dropbox_content_hash(data):
+    """Dropboxのcontent_hashと同じ方式（4MBブロックごとのSHA-256を連結してSHA-256）で計算"""
+    block_size = 4 * 1024 * 1024
+    return hashlib.sha256(b''.join(
+        hashlib.sha256(data[i:i + block_size]).digest() for i in range(0, len(data), block_size)
+    )).hexdigest()
+
+def is_same_as_dropbox(data, path):
+    """Dropbox上のファイルと内容が同一か（ファイルがなければFalse）"""
+    dropbox = dropbox_sdk()
     try:
-        if original_text:
-            lines = original_text.split('\n')
-            header_cols = lines[0].split(',') if lines else []
-            num_cols = len(header_cols) if header_cols else 4
-            for i, row in df.iterrows():
-                year_str = sanitize_value(row.get('年', ''))
-                pid_str = sanitize_value(row.get('分配PID', ''))
-                id_str = sanitize_value(row.get('分配ID', ''))
-                result_id_str = sanitize_value(row.get('整備結果ID', ''))
-                
-                if i + 1 < len(lines):
-                    values = lines[i + 1].split(',')
-                else:
-                    values = [''] * num_cols
-                    lines.append('')
-                
-                if len(values) < num_cols:
-                    values.extend([''] * (num_cols - len(values)))
-                values[0] = year_str
-                if num_cols > 1:
-                    values[1] = pid_str
-                if num_cols > 2:
-                    values[2] = id_str
-                if num_cols > 3:
-                    values[3] = result_id_str
-                
-                target_index = i + 1 if i + 1 < len(lines) else len(lines) - 1
-                lines[target_index] = ','.join(values)
-            
-            # DataFrameの行数に合わせて行を調整（ヘッダー + データ行）
-            expected_lines = len(df) + 1
-            if len(lines) > expected_lines:
-                lines = lines[:expected_lines]
-            csv_content = '\n'.join(lines)
+        meta = _get_dbx().files_get_metadata(path)
+    except dropbox.exceptions.ApiError:
+        return False
+    return getattr(meta, 'content_hash', None) == dropbox_content_hash(data)
+
+def upload_to_dropbox(data, path):
+    """Dropboxへ上書きアップロード（大きいファイルは並列のアップロードセッションで分割送信）"""
+    dropbox = dropbox_sdk()
+    dbx = _get_dbx()
+    mode = dropbox.files.WriteMode.overwrite
+    if len(data) <= UPLOAD_SESSION_THRESHOLD:
+        dbx.files_upload(data, path, mode=mode)
+        return
+    session_id = dbx.files_upload_session_start(
+        b'', session_type=dropbox.files.UploadSessionType.concurrent
+    ).session_id
+    offsets = range(0, len(data), UPLOAD_CHUNK_SIZE)
+
+    def append(offset, close=False):
+        cursor = dropbox.files.UploadSessionCursor(session_id=session_id, offset=offset)
+        dbx.files_upload_session_append_v2(
+            data[offset:offset + UPLOAD_CHUNK_SIZE], cursor, close=close
+        )
+
+    # 最後以外のチャンクを並列送信し、すべて完了してから最後のチャンクでセッションを閉じる
+    # （先に閉じると残りのチャンクが closed エラーで拒否されるため）
+    with ThreadPoolExecutor(max_workers=UPLOAD_WORKERS) as executor:
+        # list() で各チャンクの例外をここで送出させる
+        list(executor.map(append, offsets[:-1]))
+    append(offsets[-1], close=True)
+    dbx.files_upload_session_finish(
+        b'',
+        dropbox.files.UploadSessionCursor(session_id=session_id, offset=len(data)),
+        dropbox.files.CommitInfo(path=path, mode=mode)
+    )
+
+def encode_csv(csv_df):
+    """DataFrameをShift-JISのCSVバイト列に変換（表現できない文字があればBOM付きUTF-8）"""
+    for encoding in ('shift_jis', 'utf-8-sig'):
+        buf = BytesIO()
+        try:
+            csv_df.to_csv(buf, index=False, encoding=encoding, lineterminator='\n')
+        except UnicodeEncodeError:
+            continue
+        return buf.getvalue()
+
+def save_csv_to_dropbox(df, path, original_df=None):
+    """DropboxにCSVを保存（元のCSV構造を保持）し、保存した全列のDataFrameを返す"""
+    dropbox = dropbox_sdk()
+    try:
+        if original_df is not None and len(original_df.columns) > 0:
+            # 元のCSVの全列に対し、編集対象の列を列単位でまとめて上書き
+            # 非表示の行番号列で元の行と対応付け（削除行は除き、行番号が空の追加行は空文字で埋める）、
+            # 5列目以降が別の行にずれないようにする
+            if ROW_ID_COLUMN in df.columns:
+                row_ids = pd.to_numeric(df[ROW_ID_COLUMN], errors='coerce').fillna(-1).astype(int)
+            else:
+                row_ids = range(len(df))
+            csv_df = original_df.reindex(row_ids).fillna('').reset_index(drop=True)
+            # 存在しない列は空文字として扱う
+            edited = sanitize_frame(df.reindex(columns=['年', '分配PID', '分配ID', '整備結果ID'])).to_numpy()
+            num_cols = min(4, len(csv_df.columns))
+            csv_df.iloc[:, :num_cols] = edited[:, :num_cols]
         else:
             # ID列が文字列型であることを確認してからCSVに変換
-            csv_df = df.copy()
-            for col in ['年', '分配PID', '分配ID', '整備結果ID']:
-                if col in csv_df.columns:
-                    csv_df[col] = csv_df[col].apply(sanitize_value)
-            csv_content = csv_df.to_csv(index=False)
+            csv_df = df.drop(columns=ROW_ID_COLUMN, errors='ignore').reset_index(drop=True)
+            cols = [col for col in ['年', '分配PID', '分配ID', '整備結果ID'] if col in csv_df.columns]
+            csv_df[cols] = sanitize_frame(csv_df[cols])
         
-        try:
-            csv_bytes = csv_content.encode('shift_jis')
-        except UnicodeEncodeError:
-            csv_bytes = ('\uFEFF' + csv_content).encode('utf-8')
+        csv_bytes = encode_csv(csv_df)
         
-        dbx.files_upload(csv_bytes, path, mode=dropbox.files.WriteMode.overwrite)
-        return csv_content
+        # 内容が変わっていなければアップロードを省略
+        if not is_same_as_dropbox(csv_bytes, path):
+            upload_to_dropbox(csv_bytes, path)
+        # 保存でリビジョンが変わるため、キャッシュ済みのrevを破棄
+        _get_rev.clear()
+        return csv_df
+    except dropbox.exceptions.AuthError as e:
+        _clear_cached_token()
+        _get_dbx.clear()
+        st.error(f"Dropboxの認証エラー: {e}")
+        raise
     except dropbox.exceptions.ApiError as e:
         st.error(f"Dropboxへの保存エラー: {e}")
         raise
@@ -169,34 +360,47 @@ uploaded_file = st.file_uploader("id_management_file.csv を選択", type=['csv'
 # セッション状態の初期化
 if 'df' not in st.session_state:
     st.session_state.df = pd.DataFrame()
-if 'csv_text_content' not in st.session_state:
-    st.session_state.csv_text_content = None
+if 'original_df' not in st.session_state:
+    st.session_state.original_df = None
 
 df = st.session_state.df
 error_info = None
-csv_text_content = st.session_state.csv_text_content
+original_df = st.session_state.original_df
 
 if uploaded_file is not None:
-    file_bytes = uploaded_file.read()
-    df, error_info, csv_text_content = load_csv_from_bytes(file_bytes, encoding='shift_jis')
-    
-    if error_info:
-        st.error(error_info)
-    elif not df.empty:
+    file_bytes = uploaded_file.getvalue()
+    # 名前とサイズが同じでも内容が違うファイルを取り違えないよう、内容のハッシュで判定
+    upload_sig = hashlib.blake2b(file_bytes, digest_size=16).digest()
+    if st.session_state.get('last_upload_sig') == upload_sig and not df.empty:
+        # 同じファイルは再解析せず、セッションのデータ（保存済みの編集を含む）をそのまま使う
         st.success(f"✅ {uploaded_file.name} を読み込みました（Shift-JIS）")
-        st.session_state.df = df
-        st.session_state.csv_text_content = csv_text_content
+    else:
+        df, error_info, original_df = load_csv_from_bytes(file_bytes, encoding='shift_jis')
+        
+        if error_info:
+            st.error(error_info)
+        elif not df.empty:
+            st.success(f"✅ {uploaded_file.name} を読み込みました（Shift-JIS）")
+            st.session_state.df = df
+            st.session_state.original_df = original_df
+            st.session_state.last_upload_sig = upload_sig
+            st.session_state.dropbox_synced = False
 else:
     st.info("💡 ローカルファイルをアップロードするか、Dropboxから読み込みます")
     use_dropbox = st.checkbox("Dropboxから読み込む", value=False)
     
     if use_dropbox:
-        df, error_info, csv_text_content = load_csv_from_dropbox(DROPBOX_FILE_PATH)
+        if st.button("🔄 Dropboxから再取得"):
+            _get_rev.clear()
+        df, error_info, original_df = load_csv_from_dropbox(DROPBOX_FILE_PATH)
         if error_info:
             st.error(error_info)
         elif not df.empty:
             st.session_state.df = df
-            st.session_state.csv_text_content = csv_text_content
+            st.session_state.original_df = original_df
+            st.session_state.dropbox_synced = True
+            # セッションのデータがアップロードファイル由来ではなくなったため、再利用判定を解除
+            st.session_state.pop('last_upload_sig', None)
 
 if df.empty:
     st.error("❌ ファイルが読み込めませんでした")
@@ -209,70 +413,85 @@ else:
     st.caption("テーブル下部の「+ Add row」から年度行を追加できます。")
     
     if not df.empty:
-        df = df.applymap(sanitize_value)
+        df = sanitize_frame(df)
+        # 保存時に元のCSVの行（5列目以降）と対応付けるため、元の行番号を非表示列で持たせる
+        df[ROW_ID_COLUMN] = range(len(df))
 
     # デバッグ情報（開発時のみ）
+    # エキスパンダーは閉じていても中身が実行されるため、チェックボックスで出力を制御する
     with st.expander("🔧 デバッグ情報"):
-        st.write("**DataFrame型情報:**")
-        st.write(df.dtypes)
-        st.write("**DataFrame先頭5行:**")
-        st.write(df.head())
-    
-    # 編集可能なテーブル
-    try:
-        edited_df = st.data_editor(
-            df,
-            use_container_width=True,
-            num_rows="dynamic",
-            column_config={
-                "年": st.column_config.TextColumn("年"),
-                "分配PID": st.column_config.TextColumn("分配PID"),
-                "分配ID": st.column_config.TextColumn("分配ID"),
-                "整備結果ID": st.column_config.TextColumn("整備結果ID")
-            },
-            key="data_editor"
-        )
-        # 列を文字列化し「None」「nan」を空文字に変換
-        for col in ['年', '分配PID', '分配ID', '整備結果ID']:
-            if col in edited_df.columns:
-                edited_df[col] = edited_df[col].apply(sanitize_value)
-    except Exception as e:
-        st.error(f"❌ データエディタエラー: {e}")
-        st.info("デバッグ情報を確認して、DataFrame の型を確認してください。")
-        st.stop()
+        if st.checkbox("デバッグ情報を表示", key="show_debug"):
+            st.write("**DataFrame型情報:**")
+            st.write(df.dtypes)
+            st.write("**DataFrame先頭5行:**")
+            st.write(df.head())
     
-    st.markdown("---")
+    # 編集可能なテーブル（フォーム送信時にまとめて反映し、セル編集ごとの再実行を避ける）
+    with st.form("edit_form"):
+        try:
+            edited_df = st.data_editor(
+                df,
+                use_container_width=True,
+                num_rows="dynamic",
+                column_config={
+                    "年": st.column_config.TextColumn("年"),
+                    "分配PID": st.column_config.TextColumn("分配PID"),
+                    "分配ID": st.column_config.TextColumn("分配ID"),
+                    "整備結果ID": st.column_config.TextColumn("整備結果ID"),
+                    ROW_ID_COLUMN: None
+                },
+                key="data_editor"
+            )
+            # 列を文字列化し「None」「nan」を空文字に変換（追加行の None など）
+            cols = [col for col in ['年', '分配PID', '分配ID', '整備結果ID'] if col in edited_df.columns]
+            edited_df[cols] = sanitize_frame(edited_df[cols])
+        except Exception as e:
+            st.error(f"❌ データエディタエラー: {e}")
+            st.info("デバッグ情報を確認して、DataFrame の型を確認してください。")
+            st.stop()
+        
+        st.markdown("---")
+        
+        # ボタンセクション
+        col1, col2 = st.columns([1, 1])
+        with col1:
+            reset_clicked = st.form_submit_button("🔄 リセット", use_container_width=True)
+        with col2:
+            save_clicked = st.form_submit_button("✅ 変更を保存", type="primary", use_container_width=True)
     
-    # ボタンセクション
-    col1, col2 = st.columns([1, 1])
+    # 保存直後の再実行で、保存完了メッセージを一度だけ表示
+    if 'save_message' in st.session_state:
+        st.success(st.session_state.pop('save_message'))
     
-    with col1:
-        if st.button("🔄 リセット", use_container_width=True):
-            # セッション状態をクリアしてファイルから再読み込み
-            if 'df' in st.session_state:
-                del st.session_state.df
-            if 'csv_text_content' in st.session_state:
-                del st.session_state.csv_text_content
-            st.rerun()
+    if reset_clicked:
+        # セッション状態をクリアしてファイルから再読み込み
+        if 'df' in st.session_state:
+            del st.session_state.df
+        if 'original_df' in st.session_state:
+            del st.session_state.original_df
+        st.rerun()
     
-    with col2:
-        if st.button("✅ 変更を保存", type="primary", use_container_width=True):
-            df = edited_df.copy()
-            # ID列を文字列型に確実に変換
-            for col in ['年', '分配PID', '分配ID', '整備結果ID']:
-                if col in df.columns:
-                    df[col] = df[col].apply(sanitize_value)
-            try:
-                updated_text = save_csv_to_dropbox(
-                    df,
-                    DROPBOX_FILE_PATH,
-                    st.session_state.csv_text_content
-                )
-                if updated_text is not None:
-                    st.session_state.csv_text_content = updated_text
-            except Exception as save_error:
-                st.error(f"❌ 保存に失敗しました: {save_error}")
-                st.stop()
-            st.session_state.df = df
-            st.success("Dropboxに保存しました")
-            st.rerun()
\ No newline at end of file
+    if save_clicked:
+        # Dropboxの内容から何も編集していなければ、保存（API呼び出し）を省略
+        if st.session_state.get('dropbox_synced') and edited_df.equals(df):
+            st.info("変更はありません")
+            st.stop()
+        # edited_df はエディタ直後に文字列化・空文字変換済み
+        df = edited_df
+        try:
+            saved_df = save_csv_to_dropbox(
+                df,
+                DROPBOX_FILE_PATH,
+                st.session_state.original_df
+            )
+            if saved_df is not None:
+                st.session_state.original_df = saved_df
+        except Exception as save_error:
+            st.error(f"❌ 保存に失敗しました: {save_error}")
+            st.stop()
+        # 保存した全列のDataFrameと行番号を揃え、次回の保存でも正しく対応付ける
+        st.session_state.df = df.drop(columns=ROW_ID_COLUMN).reset_index(drop=True)
+        st.session_state.dropbox_synced = True
+        # データエディタを保存後のDataFrameで作り直すため再実行し、完了メッセージは再実行後に表示する
+        st.session_state.save_message = "Dropboxに保存しました"
+        st.rerun()